@@ -1,23 +1,60 @@
+import asyncio
+import json
+
+import httpx
 import pytest
-import respx
-from httpx import Response
 
-from mvg_mcp_server import MVGDataFetcher
+import mvg_mcp_server
+
+MVG_API_RESPONSE = [
+    {
+        "type": "INCIDENT",
+        "title": "U-Bahn Störung",
+        "description": "Signalstörung auf der U3",
+        "lines": [{"label": "U3"}],
+    },
+    {
+        "type": "INFO",
+        "title": "Bauarbeiten",
+        "description": "Informationen zu Bauarbeiten",
+    }
+]
+
+# Serialized once, every mocked request just wraps these bytes
+MVG_API_BODY = json.dumps(MVG_API_RESPONSE).encode()
+
+
+class MockMVGAPI:
+    """In-memory MVG API that counts the requests it receives"""
+
+    def __init__(self):
+        self.call_count = 0
+        self.transport = httpx.MockTransport(self.handle_request)
+        self.client = httpx.AsyncClient(transport=self.transport)
+
+    def reset(self):
+        self.call_count = 0
+
+    async def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.call_count += 1
+        # Yield to the event loop like a real network round-trip would
+        await asyncio.sleep(0)
+        return httpx.Response(200, content=MVG_API_BODY, headers={"Content-Type": "application/json"})
+
+
+@pytest.fixture(scope="session")
+def mvg_api():
+    # Built once per session, the in-memory transport holds no connections
+    api = MockMVGAPI()
+    yield api
+    asyncio.run(api.client.aclose())
+
 
 @pytest.fixture
-def mock_mvg_api():
-    with respx.mock(base_url=MVGDataFetcher.MVG_API_URL) as mock:
-        mock.get("/").respond(200, json=[
-            {
-                "type": "INCIDENT",
-                "title": "U-Bahn Störung",
-                "description": "Signalstörung auf der U3",
-                "lines": [{"label": "U3"}],
-            },
-            {
-                "type": "INFO",
-                "title": "Bauarbeiten",
-                "description": "Informationen zu Bauarbeiten",
-            }
-        ])
-        yield mock
+def mock_mvg_api(mvg_api, monkeypatch):
+    mvg_api.reset()
+    monkeypatch.setattr(mvg_mcp_server.fetcher, "client", mvg_api.client)
+    # asyncio primitives bind to the loop they first run in, every test gets its own loop
+    monkeypatch.setattr(mvg_mcp_server._STATE, "refresh_lock", asyncio.Lock())
+    monkeypatch.setattr(mvg_mcp_server._STATE, "refresh_task", None)
+    yield mvg_api
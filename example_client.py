@@ -6,154 +6,77 @@ This demonstrates how to interact with the server programmatically
 
 import asyncio
 import json
-import subprocess
 import sys
-from typing import Any, Dict
-
-
-class MCPClient:
-    """Simple MCP client for testing"""
-    
-    def __init__(self, server_command: str):
-        self.server_command = server_command
-        self.process = None
-    
-    async def start(self):
-        """Start the MCP server process"""
-        self.process = await asyncio.create_subprocess_exec(
-            *self.server_command.split(),
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-    
-    async def send_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
-        """Send a request to the MCP server"""
-        if not self.process:
-            raise RuntimeError("Server not started")
-        
-        request_json = json.dumps(request) + "\n"
-        self.process.stdin.write(request_json.encode())
-        await self.process.stdin.drain()
-        
-        # Read response
-        response_line = await self.process.stdout.readline()
-        if not response_line:
-            raise RuntimeError("No response from server")
-        
-        return json.loads(response_line.decode())
-    
-    async def close(self):
-        """Close the client and terminate server"""
-        if self.process:
-            self.process.terminate()
-            await self.process.wait()
+from contextlib import AsyncExitStack
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional and not available on Windows
+    uvloop = None
+
+
+SERVER_PARAMS = StdioServerParameters(
+    command=sys.executable,
+    args=["mvg_mcp_server.py"],
+)
 
 
 async def test_mcp_protocol():
     """Test the MCP protocol with the server"""
     print("Testing MCP Protocol...")
-    
-    client = MCPClient("python mvg_mcp_server.py")
-    
-    try:
-        await client.start()
-        
-        # Test initialization
-        print("1. Testing initialization...")
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {
-                    "name": "test-client",
-                    "version": "1.0.0"
-                }
-            }
-        }
-        
-        response = await client.send_request(init_request)
-        print(f"Init response: {response}")
-        
-        # Test listing tools
-        print("\n2. Testing list tools...")
-        list_tools_request = {
-            "jsonrpc": "2.0",
-            "id": 2,
-            "method": "tools/list"
-        }
-        
-        response = await client.send_request(list_tools_request)
-        print(f"Tools: {[tool['name'] for tool in response.get('result', {}).get('tools', [])]}")
-        
-        # Test calling get_mvg_incidents tool
-        print("\n3. Testing get_mvg_incidents tool...")
-        call_tool_request = {
-            "jsonrpc": "2.0",
-            "id": 3,
-            "method": "tools/call",
-            "params": {
-                "name": "get_mvg_incidents",
-                "arguments": {}
-            }
-        }
-        
-        response = await client.send_request(call_tool_request)
-        if "result" in response:
-            content = response["result"]["content"][0]["text"]
-            data = json.loads(content)
-            print(f"Retrieved {data['count']} incidents")
-            print(f"Cache status: {data['cache_info']['status']}")
-        
-        # Test search tool
-        print("\n4. Testing search_incidents tool...")
-        search_request = {
-            "jsonrpc": "2.0",
-            "id": 4,
-            "method": "tools/call",
-            "params": {
-                "name": "search_incidents",
-                "arguments": {
-                    "query": "verspätung"
-                }
-            }
-        }
-        
-        response = await client.send_request(search_request)
-        if "result" in response:
-            content = response["result"]["content"][0]["text"]
-            data = json.loads(content)
-            print(f"Search found {data['count']} incidents matching 'verspätung'")
-        
-        # Test cache status
-        print("\n5. Testing get_cache_status tool...")
-        cache_status_request = {
-            "jsonrpc": "2.0",
-            "id": 5,
-            "method": "tools/call",
-            "params": {
-                "name": "get_cache_status",
-                "arguments": {}
-            }
-        }
-        
-        response = await client.send_request(cache_status_request)
-        if "result" in response:
-            content = response["result"]["content"][0]["text"]
-            cache_info = json.loads(content)
-            print(f"Cache status: {cache_info}")
-        
-        print("\n✓ MCP Protocol tests completed successfully!")
-        
-    except Exception as e:
-        print(f"✗ MCP Protocol test failed: {e}")
-        return False
-    finally:
-        await client.close()
-    
+
+    async with AsyncExitStack() as stack:
+        try:
+            read_stream, write_stream = await stack.enter_async_context(stdio_client(SERVER_PARAMS))
+            session = await stack.enter_async_context(ClientSession(read_stream, write_stream))
+
+            # Test initialization
+            print("1. Testing initialization...")
+            init_result = await session.initialize()
+            print(f"Init response: {init_result.serverInfo.name} {init_result.serverInfo.version}")
+
+            # These requests are independent, so issue them concurrently;
+            # ClientSession matches responses to requests by id
+            tools_result, incidents_result, search_result = await asyncio.gather(
+                session.list_tools(),
+                session.call_tool("get_mvg_incidents", {}),
+                session.call_tool("search_incidents", {"query": "verspätung"}),
+            )
+            # The cache status depends on the fetch above, so ask for it afterwards
+            cache_result = await session.call_tool("get_cache_status", {})
+
+            # Test listing tools
+            print("\n2. Testing list tools...")
+            print(f"Tools: {[tool.name for tool in tools_result.tools]}")
+
+            # Test calling get_mvg_incidents tool
+            print("\n3. Testing get_mvg_incidents tool...")
+            if not incidents_result.isError:
+                data = json.loads(incidents_result.content[0].text)
+                print(f"Retrieved {data['count']} incidents")
+                print(f"Cache status: {data['cache_info']['status']}")
+
+            # Test search tool
+            print("\n4. Testing search_incidents tool...")
+            if not search_result.isError:
+                data = json.loads(search_result.content[0].text)
+                print(f"Search found {data['count']} incidents matching 'verspätung'")
+
+            # Test cache status
+            print("\n5. Testing get_cache_status tool...")
+            if not cache_result.isError:
+                cache_info = json.loads(cache_result.content[0].text)
+                print(f"Cache status: {cache_info}")
+
+            print("\n✓ MCP Protocol tests completed successfully!")
+
+        except Exception as e:
+            print(f"✗ MCP Protocol test failed: {e}")
+            return False
+
     return True
 
 
@@ -161,9 +84,9 @@ async def main():
     """Run the example client"""
     print("MVG MCP Server - Example Client")
     print("=" * 40)
-    
+
     success = await test_mcp_protocol()
-    
+
     if success:
         print("\n🎉 All client tests passed!")
         return 0
@@ -173,4 +96,5 @@ async def main():
 
 
 if __name__ == "__main__":
-    sys.exit(asyncio.run(main()))
\ No newline at end of file
+    run = uvloop.run if uvloop is not None else asyncio.run
+    sys.exit(run(main()))
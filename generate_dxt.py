@@ -1,12 +1,189 @@
 import asyncio
+import hashlib
 import os
+import queue
 import shutil
+import string
 import zipfile
 import json
-import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # orjson is optional when building the package
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional and not available on Windows
+    uvloop = None
+
+try:
+    from isal import isal_zlib
+except ImportError:  # isal is optional, zipfile keeps using zlib
+    isal_zlib = None
+else:
+    # ISA-L's SIMD deflate is a drop-in replacement for zipfile's zlib
+    zipfile.zlib = isal_zlib
+
+# Deflate level for the .dxt archive: ISA-L tops out at level 3,
+# zlib uses its default of 6
+ZIP_COMPRESSLEVEL = isal_zlib.ISAL_BEST_COMPRESSION if isal_zlib is not None else 6
+ZIP_CHUNK_SIZE = 1 << 20
+
+DXT_OUTPUT = "mvg_stoerung_mcp.dxt"
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+ARCHIVE_SKIP_DIRS = {"venv", "__pycache__"}
+
+# Bundled files the bootstrap never imports: bytecode is regenerated,
+# type stubs and test suites are unused. Licenses and METADATA are kept.
+LIB_PRUNE_DIRS = {"__pycache__", "tests"}
+LIB_PRUNE_SUFFIXES = (".pyc", ".pyo", ".pyi")
+
+# Tools exposed by the server, listed statically so the build needs no server import
+TOOLS = [
+    {
+        "name": "get_mvg_incidents",
+        "description": "Get current MVG incidents (cached for 10+ minutes)"
+    },
+    {
+        "name": "get_cache_status", 
+        "description": "Get information about the cache status"
+    },
+    {
+        "name": "search_incidents",
+        "description": "Search incidents by line, title, or description"
+    }
+]
+
+# Static manifest.json content, the tool list is merged in at build time
+MANIFEST_BASE = {
+    "dxt_version": "0.1",
+    "name": "mvg-stoerung-mcp",
+    "display_name": "MVG Stoerung MCP Server",
+    "version": "1.1.0",
+    "description": "Munich Public Transport (MVG) disruption data MCP server with intelligent caching",
+    "long_description": "This extension provides cached access to Munich Public Transport (MVG) disruption data through an MCP server. It implements intelligent 10+ minute caching, search functionality, and real-time incident monitoring for the Munich transit system. This version includes bundled dependencies for easier deployment.",
+    "author": {
+        "name": "MVG Stoerung MCP",
+        "url": "https://github.com/rmoriz/mvg_stoerung_mcp"
+    },
+    "repository": {
+        "type": "git",
+        "url": "https://github.com/rmoriz/mvg_stoerung_mcp"
+    },
+    "server": {
+        "type": "python",
+        "entry_point": "server/bootstrap.py",
+        "mcp_config": {
+            "command": "python3",
+            "args": ["${__dirname}/server/bootstrap.py"],
+            "env": {
+                "PYTHONPATH": "${__dirname}/server/lib:${__dirname}/server"
+            }
+        }
+    },
+    "keywords": ["mvg", "munich", "transport", "public-transport", "incidents", "disruption", "mcp"],
+    "license": "CC0-1.0",
+    "compatibility": {
+        "claude_desktop": ">=0.10.0",
+        "platforms": ["darwin", "win32", "linux"],
+        "runtimes": {
+            "python": ">=3.8.0 <4"
+        }
+    },
+    "bundle_info": {
+        "type": "self-contained",
+        "dependencies_location": "server/lib/",
+        "venv_included": False,
+        "bootstrap_script": "server/bootstrap.py"
+    }
+}
+
+README_HEADER = string.Template("""# $display_name
+
+$long_description
+
+## Quick Start
+
+This DXT package includes all dependencies bundled in the `lib/` directory.
+
+### Installation
+1. Download the `.dxt` file
+2. Open with Claude Desktop
+3. The extension will be automatically configured
+
+## Tools Available
+
+""")
+
+README_TOOL = string.Template("### $name\n$description\n\n")
+
+README_FOOTER = """## Bundle Information
+
+This package uses a refactored bundling approach:
+- Dependencies bundled in `server/lib/` directory (including transitive dependencies like anyio)
+- No virtual environment included (smaller package size)
+- Bootstrap script handles Python path setup automatically
+
+## Technical Details
+
+- Runtime: Python 3.8+
+- Protocol: Model Context Protocol (MCP)
+- Dependencies: httpx, pydantic, orjson, mcp, anyio (all bundled)
+
+## Disclaimer
+
+This project is not an official MVG project, not endorsed or recommended. Please ask MVG for permission prior to using it.
+"""
+
+def dump_json(obj) -> bytes:
+    """Serialize obj as indented UTF-8 JSON, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+
+def pip_install_command(lib_dir: str, requirements: list) -> list:
+    """Build the install command, preferring uv's parallel installer when available"""
+    uv = shutil.which("uv")
+    if uv is not None:
+        # uv doesn't byte-compile by default; pin it to the interpreter running this script
+        return [
+            uv, "pip", "install",
+            "--python", sys.executable,
+            "--target", lib_dir,
+            *requirements
+        ]
+    return [
+        sys.executable, "-m", "pip", "install",
+        "--target", lib_dir,
+        "--no-compile",
+        *requirements
+    ]
+
+async def pip_install(lib_dir: str, requirements: list) -> tuple:
+    """Install requirements into lib_dir, returning (returncode, stderr)"""
+    process = await asyncio.create_subprocess_exec(
+        *pip_install_command(lib_dir, requirements),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    _, stderr = await process.communicate()
+    return process.returncode, stderr.decode(errors="replace")
+
+def prune_lib(lib_dir: str):
+    """Remove files from lib/ that are never used at runtime (bytecode, stubs, tests, RECORD)"""
+    for root, dirs, files in os.walk(lib_dir):
+        for name in [d for d in dirs if d in LIB_PRUNE_DIRS]:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            dirs.remove(name)
+        
+        for name in files:
+            if name.endswith(LIB_PRUNE_SUFFIXES) or (name == "RECORD" and root.endswith(".dist-info")):
+                os.remove(os.path.join(root, name))
+
 async def download_dependencies(lib_dir: str, requirements_file: str = "requirements.txt"):
     """Download Python dependencies to lib/ directory using pip"""
     print("Downloading Python dependencies...")
@@ -20,20 +197,20 @@ async def download_dependencies(lib_dir: str, requirements_file: str = "requirem
     
     print(f"Dependencies to download: {requirements}")
     
-    # Download each package to lib directory (WITH dependencies to get anyio, etc.)
-    for requirement in requirements:
-        print(f"Downloading {requirement}...")
-        try:
-            # Install package files for direct import (including transitive dependencies)
-            subprocess.run([
-                sys.executable, "-m", "pip", "install",
-                "--target", lib_dir,
-                requirement
-            ], capture_output=True, text=True, check=True)
-            
-        except subprocess.CalledProcessError as e:
-            print(f"Warning: Failed to download {requirement}: {e}")
+    # Install all packages in one pip run (WITH dependencies to get anyio, etc.)
+    print("Downloading all requirements in a single install run...")
+    returncode, stderr = await pip_install(lib_dir, requirements)
     
+    if returncode != 0:
+        # Fall back to per-package installs so one bad requirement doesn't sink the rest
+        print(f"Warning: Combined install failed, retrying per package: {stderr.strip()}")
+        for requirement in requirements:
+            print(f"Downloading {requirement}...")
+            returncode, stderr = await pip_install(lib_dir, [requirement])
+            if returncode != 0:
+                print(f"Warning: Failed to download {requirement}: {stderr.strip()}")
+    
+    prune_lib(lib_dir)
     print("Dependencies downloaded to lib/ (including transitive dependencies)")
 
 def create_bootstrap_script(temp_dir: str):
@@ -55,9 +232,8 @@ if lib_dir.exists():
 
 # Import and run the main server
 try:
-    from mvg_mcp_server import main
-    import asyncio
-    asyncio.run(main())
+    from mvg_mcp_server import run
+    run()
 except ImportError as e:
     print(f"Error importing mvg_mcp_server: {e}")
     print("Make sure all dependencies are properly bundled in lib/")
@@ -72,6 +248,109 @@ except ImportError as e:
     os.chmod(bootstrap_path, 0o755)
     print("Created bootstrap script")
 
+def write_manifest(temp_dir: str, manifest: dict):
+    """Write manifest.json into the package directory"""
+    print("Creating manifest.json...")
+    with open(f"{temp_dir}/manifest.json", "wb") as f:
+        f.write(dump_json(manifest))
+
+def copy_server_files(temp_dir: str):
+    """Copy the server module and a requirements reference into server/"""
+    print("Copying server files...")
+    shutil.copy2("mvg_mcp_server.py", f"{temp_dir}/server/")
+    
+    # Create requirements reference
+    with open(f"{temp_dir}/server/requirements.txt", "w", encoding='utf-8') as f:
+        f.write("# Dependencies are bundled in lib/ directory\n")
+        f.write("# Original requirements:\n")
+        with open("requirements.txt", "r") as orig:
+            for line in orig:
+                f.write(f"# {line}")
+
+def write_readme(temp_dir: str, manifest: dict, tools: list):
+    """Write the package README listing the available tools"""
+    readme_parts = [README_HEADER.substitute(manifest)]
+    readme_parts.extend(README_TOOL.substitute(tool) for tool in tools)
+    
+    readme_parts.append(README_FOOTER)
+    readme_content = "".join(readme_parts)
+    
+    with open(f"{temp_dir}/README.md", "w", encoding='utf-8') as f:
+        f.write(readme_content)
+
+def iter_package_files(path: str):
+    """Yield DirEntry objects for all files below path, skipping venv and bytecode dirs"""
+    # Sorted so archive member order doesn't depend on filesystem order
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+    
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name in ARCHIVE_SKIP_DIRS or entry.name.startswith('.venv'):
+                continue
+            yield from iter_package_files(entry.path)
+        elif entry.is_file():
+            yield entry
+
+def write_archive_entries(output_path: str, entries: queue.Queue):
+    """Write (zinfo, file_path) entries from the queue into the archive until None arrives"""
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED,
+                         compresslevel=ZIP_COMPRESSLEVEL, strict_timestamps=False) as zipf:
+        while True:
+            entry = entries.get()
+            if entry is None:
+                break
+            
+            zinfo, file_path = entry
+            # Stream in chunks instead of reading whole files into memory
+            with open(file_path, 'rb') as src, zipf.open(zinfo, 'w') as dst:
+                shutil.copyfileobj(src, dst, ZIP_CHUNK_SIZE)
+
+def create_archive(temp_dir: str, output_path: str):
+    """Zip the package directory into the .dxt archive"""
+    print("Creating DXT archive...")
+    # ZipFile isn't thread-safe, so a single writer thread compresses while
+    # this thread walks the tree. The queue is unbounded so a failing writer
+    # can never block the walk.
+    entries = queue.Queue()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        writer = executor.submit(write_archive_entries, output_path, entries)
+        try:
+            for entry in iter_package_files(temp_dir):
+                arcname = os.path.relpath(entry.path, temp_dir)
+                
+                if 'venv' in arcname or '.venv' in arcname:
+                    continue
+                
+                # Fixed timestamp and creator system keep rebuilds byte-identical
+                zinfo = zipfile.ZipInfo(arcname, date_time=ZIP_DATE_TIME)
+                zinfo.create_system = 3
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                # ZipFile.open() ignores the archive-wide level for explicit ZipInfo entries
+                zinfo._compresslevel = ZIP_COMPRESSLEVEL
+                # The known size lets zipfile decide on ZIP64 per entry when streaming
+                zinfo.file_size = entry.stat().st_size
+                
+                if (arcname.endswith('.py') and 'bootstrap' in arcname):
+                    zinfo.external_attr = 0o755 << 16
+                else:
+                    zinfo.external_attr = 0o644 << 16
+                
+                entries.put((zinfo, entry.path))
+        finally:
+            entries.put(None)
+        
+        # Re-raise any error from the writer thread
+        writer.result()
+
+def file_sha256(path: str) -> str:
+    """Return the hex SHA-256 digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(ZIP_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 async def main():
     """Generates a refactored DXT extension with bundled libraries in lib/"""
     # Create temporary directory
@@ -89,150 +368,17 @@ async def main():
         # Create bootstrap script
         create_bootstrap_script(temp_dir)
         
-        # Define tools and resources statically
-        tools = [
-            {
-                "name": "get_mvg_incidents",
-                "description": "Get current MVG incidents (cached for 10+ minutes)"
-            },
-            {
-                "name": "get_cache_status", 
-                "description": "Get information about the cache status"
-            },
-            {
-                "name": "search_incidents",
-                "description": "Search incidents by line, title, or description"
-            }
-        ]
-        
-        # Create manifest.json
-        manifest = {
-            "dxt_version": "0.1",
-            "name": "mvg-stoerung-mcp",
-            "display_name": "MVG Stoerung MCP Server",
-            "version": "1.1.0",
-            "description": "Munich Public Transport (MVG) disruption data MCP server with intelligent caching",
-            "long_description": "This extension provides cached access to Munich Public Transport (MVG) disruption data through an MCP server. It implements intelligent 10+ minute caching, search functionality, and real-time incident monitoring for the Munich transit system. This version includes bundled dependencies for easier deployment.",
-            "author": {
-                "name": "MVG Stoerung MCP",
-                "url": "https://github.com/rmoriz/mvg_stoerung_mcp"
-            },
-            "repository": {
-                "type": "git",
-                "url": "https://github.com/rmoriz/mvg_stoerung_mcp"
-            },
-            "server": {
-                "type": "python",
-                "entry_point": "server/bootstrap.py",
-                "mcp_config": {
-                    "command": "python3",
-                    "args": ["${__dirname}/server/bootstrap.py"],
-                    "env": {
-                        "PYTHONPATH": "${__dirname}/server/lib:${__dirname}/server"
-                    }
-                }
-            },
-            "tools": tools,
-            "keywords": ["mvg", "munich", "transport", "public-transport", "incidents", "disruption", "mcp"],
-            "license": "CC0-1.0",
-            "compatibility": {
-                "claude_desktop": ">=0.10.0",
-                "platforms": ["darwin", "win32", "linux"],
-                "runtimes": {
-                    "python": ">=3.8.0 <4"
-                }
-            },
-            "bundle_info": {
-                "type": "self-contained",
-                "dependencies_location": "server/lib/",
-                "venv_included": False,
-                "bootstrap_script": "server/bootstrap.py"
-            }
-        }
-        
-        # Write manifest.json
-        print("Creating manifest.json...")
-        with open(f"{temp_dir}/manifest.json", "w", encoding='utf-8') as f:
-            json.dump(manifest, f, indent=2, ensure_ascii=False)
-        
-        # Copy server files
-        print("Copying server files...")
-        shutil.copy2("mvg_mcp_server.py", f"{temp_dir}/server/")
-        
-        # Create requirements reference
-        with open(f"{temp_dir}/server/requirements.txt", "w", encoding='utf-8') as f:
-            f.write("# Dependencies are bundled in lib/ directory\n")
-            f.write("# Original requirements:\n")
-            with open("requirements.txt", "r") as orig:
-                for line in orig:
-                    f.write(f"# {line}")
-        
-        # Create README
-        readme_content = f"""# {manifest['display_name']}
-
-{manifest['long_description']}
-
-## Quick Start
-
-This DXT package includes all dependencies bundled in the `lib/` directory.
-
-### Installation
-1. Download the `.dxt` file
-2. Open with Claude Desktop
-3. The extension will be automatically configured
-
-## Tools Available
-
-"""
-        for tool in tools:
-            readme_content += f"### {tool['name']}\n{tool['description']}\n\n"
-        
-        readme_content += """## Bundle Information
-
-This package uses a refactored bundling approach:
-- Dependencies bundled in `server/lib/` directory (including transitive dependencies like anyio)
-- No virtual environment included (smaller package size)
-- Bootstrap script handles Python path setup automatically
-
-## Technical Details
-
-- Runtime: Python 3.8+
-- Protocol: Model Context Protocol (MCP)
-- Dependencies: httpx, pydantic, mcp, anyio (all bundled)
-
-## Disclaimer
-
-This project is not an official MVG project, not endorsed or recommended. Please ask MVG for permission prior to using it.
-"""
+        manifest = {**MANIFEST_BASE, "tools": TOOLS}
         
-        with open(f"{temp_dir}/README.md", "w", encoding='utf-8') as f:
-            f.write(readme_content)
+        # Write manifest.json, server files and README
+        write_manifest(temp_dir, manifest)
+        copy_server_files(temp_dir)
+        write_readme(temp_dir, manifest, TOOLS)
         
         # Create zip archive
-        print("Creating DXT archive...")
-        with zipfile.ZipFile("mvg_stoerung_mcp.dxt", "w", zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(temp_dir):
-                dirs[:] = [d for d in dirs if d != 'venv' and not d.startswith('.venv')]
-                
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, temp_dir)
-                    
-                    if 'venv' in arcname or '.venv' in arcname:
-                        continue
-                    
-                    zinfo = zipfile.ZipInfo(arcname)
-                    zinfo.compress_type = zipfile.ZIP_DEFLATED
-                    
-                    if (arcname.endswith('.py') and 'bootstrap' in arcname):
-                        zinfo.external_attr = 0o755 << 16
-                    else:
-                        zinfo.external_attr = 0o644 << 16
-                    
-                    with open(file_path, 'rb') as src:
-                        zipf.writestr(zinfo, src.read())
+        create_archive(temp_dir, DXT_OUTPUT)
         
-        print("\nmvg_stoerung_mcp.dxt generated successfully!")
+        print(f"\n{DXT_OUTPUT} generated successfully!")
         print("\nPackage Contents:")
         print("- manifest.json (DXT specification)")
         print("- README.md (documentation)")
@@ -246,9 +392,10 @@ This project is not an official MVG project, not endorsed or recommended. Please
         print("- Automatic Python path setup")
         print("- Smaller package size")
         
-        if os.path.exists("mvg_stoerung_mcp.dxt"):
-            size_mb = os.path.getsize("mvg_stoerung_mcp.dxt") / (1024 * 1024)
+        if os.path.exists(DXT_OUTPUT):
+            size_mb = os.path.getsize(DXT_OUTPUT) / (1024 * 1024)
             print(f"\nPackage size: {size_mb:.2f} MB")
+            print(f"Package SHA-256: {file_sha256(DXT_OUTPUT)}")
         
     finally:
         if os.path.exists(temp_dir):
@@ -256,4 +403,5 @@ This project is not an official MVG project, not endorsed or recommended. Please
             print(f"\nCleaned up temporary directory: {temp_dir}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run = uvloop.run if uvloop is not None else asyncio.run
+    run(main())
\ No newline at end of file
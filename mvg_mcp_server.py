@@ -9,13 +9,14 @@ People should ask MVG for permission prior using it.
 """
 
 import asyncio
-import json
 import logging
 import sys
+import time
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 
 import httpx
+import orjson
 from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
 from mcp.server.stdio import stdio_server
@@ -24,7 +25,11 @@ from mcp.types import (
     Tool,
     TextContent,
 )
-from pydantic import BaseModel
+
+try:
+    import uvloop
+except ImportError:  # uvloop is optional and not available on Windows
+    uvloop = None
 
 
 # Configure logging
@@ -32,134 +37,259 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class CachedData(BaseModel):
-    """Model for cached MVG data"""
-    data: List[Dict[str, Any]]
-    timestamp: datetime
-    expires_at: datetime
+_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+
+_READABLE_TIMESTAMP_FORMAT = "%d.%m.%Y %H:%M"
+# Incident timestamp fields and the readable fields derived from them
+_TIMESTAMP_FIELDS = (
+    ("publication", "publication_readable"),
+    ("validFrom", "validFrom_readable"),
+    ("validTo", "validTo_readable"),
+)
+# Millisecond timestamps from 1970-01-01 up to 2100-01-01 convert on every platform
+_MAX_TIMESTAMP_MS = 4102444800000
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize obj as indented JSON, keeping non-ASCII characters"""
+    return orjson.dumps(obj, option=_JSON_OPTIONS).decode()
+
+
+def _nest_json(serialized: str) -> str:
+    """Re-indent an indented JSON document to sit one level deep inside an object"""
+    # Newlines inside JSON strings are escaped, so every raw newline is indentation
+    return serialized.replace("\n", "\n  ")
+
+
+# Per-incident search data: title, description and line labels joined and
+# lowercased, plus the line labels joined and uppercased. _search_response()
+# matches nothing for queries containing the separator, which keeps every
+# match inside one field.
+SearchEntry = Tuple[str, str]
+_SEARCH_SEPARATOR = "\x01"
+# search_incidents argument types that can key the memoized responses
+_SEARCH_ARG_TYPES = (str, type(None))
+# Upper bound on memoized search responses per cached incident list
+_MAX_SEARCH_RESPONSES = 128
+
+
+def _search_entry(incident: Dict[str, Any]) -> SearchEntry:
+    """Precompute the case-folded haystacks search_incidents matches against"""
+    lines = incident.get("lines")
+    labels = [
+        line["label"] for line in lines
+        if isinstance(line, dict) and isinstance(line.get("label"), str)
+    ] if type(lines) is list else []
+    labels_text = _SEARCH_SEPARATOR.join(labels)
+    title = incident.get("title")
+    description = incident.get("description")
+    # Non-string fields are left out of the haystack instead of failing the whole set()
+    text = _SEARCH_SEPARATOR.join((
+        title if isinstance(title, str) else "",
+        description if isinstance(description, str) else "",
+        labels_text,
+    ))
+    return text.lower(), labels_text.upper()
+
+
+_EMPTY_CACHE_INFO_JSON = _dumps({"status": "empty", "cached_items": 0})
 
 
 class MVGCache:
     """Simple in-memory cache for MVG data with 10+ minute expiration"""
     
-    def __init__(self, cache_duration_minutes: int = 10):
+    def __init__(self, cache_duration_minutes: int = 10, stale_grace_minutes: int = 5):
         self.cache_duration = timedelta(minutes=cache_duration_minutes)
-        self._cached_data: Optional[CachedData] = None
+        self._cache_duration_seconds = cache_duration_minutes * 60.0
+        self._stale_grace_seconds = stale_grace_minutes * 60.0
+        self._cache_duration_minutes = self.cache_duration.total_seconds() / 60
+        self.clear()
+    
+    def clear(self) -> None:
+        """Drop all cached data"""
+        self._data: Optional[List[Dict[str, Any]]] = None
+        self._serialized: Optional[str] = None
+        self._search_index: Optional[List[SearchEntry]] = None
+        # Status-less cache info, built once per set() for both the dict and JSON forms
+        self._cache_info: Optional[Dict[str, Any]] = None
+        self._deadline = 0.0  # time.monotonic() value at which the data expires
+        self._cache_info_valid_json: Optional[str] = None
+        self._cache_info_expired_json: Optional[str] = None
+        self._search_responses: Dict[Tuple[Optional[str], Optional[str]], str] = {}
     
     def is_expired(self) -> bool:
         """Check if cached data is expired"""
-        if self._cached_data is None:
-            return True
-        return datetime.now() >= self._cached_data.expires_at
+        # Monotonic float compare, immune to wall-clock adjustments
+        return self._data is None or time.monotonic() >= self._deadline
     
     def get(self) -> Optional[List[Dict[str, Any]]]:
         """Get cached data if not expired"""
         if self.is_expired():
             return None
-        return self._cached_data.data
+        return self._data
+    
+    def get_stale_ok(self) -> Optional[List[Dict[str, Any]]]:
+        """Get cached data if not expired or expired within the stale grace period"""
+        if self._data is None or time.monotonic() >= self._deadline + self._stale_grace_seconds:
+            return None
+        return self._data
     
     def set(self, data: List[Dict[str, Any]]) -> None:
         """Cache new data with expiration"""
         now = datetime.now()
-        self._cached_data = CachedData(
-            data=data,
-            timestamp=now,
-            expires_at=now + self.cache_duration
-        )
-        logger.info(f"Cached {len(data)} incidents, expires at {self._cached_data.expires_at}")
+        expires_at = now + self.cache_duration
+        # Everything that can raise is computed before any attribute changes,
+        # so a failed set() leaves the previous data fully intact.
+        # Kept as decoded text: MCP responses are str, so reads need no decode
+        serialized = _dumps(data)
+        search_index = [_search_entry(incident) for incident in data]
+        # Only the status flips until the next set(), so serialize both variants now
+        cache_info = {
+            "cached_items": len(data),
+            "cached_at": now.isoformat(),
+            "expires_at": expires_at.isoformat(),
+            "cache_duration_minutes": self._cache_duration_minutes
+        }
+        cache_info_valid_json = _dumps({"status": "valid", **cache_info})
+        cache_info_expired_json = _dumps({"status": "expired", **cache_info})
+        
+        # Plain attributes: the data comes straight from the API parser and
+        # needs no validation pass
+        self._data = data
+        self._serialized = serialized
+        self._search_index = search_index
+        self._cache_info = cache_info
+        self._cache_info_valid_json = cache_info_valid_json
+        self._cache_info_expired_json = cache_info_expired_json
+        self._search_responses = {}
+        self._deadline = time.monotonic() + self._cache_duration_seconds
+        logger.info(f"Cached {len(data)} incidents, expires at {expires_at}")
+    
+    def get_serialized(self) -> Optional[str]:
+        """Get cached data pre-serialized as JSON (expiry is checked by get())"""
+        return self._serialized
+    
+    def get_search_index(self) -> Optional[List[SearchEntry]]:
+        """Get the search index of the cached data (expiry is checked by get())"""
+        return self._search_index
+    
+    def holds(self, data: List[Dict[str, Any]]) -> bool:
+        """Check if data is the currently cached list, expired or not"""
+        return data is self._data
+    
+    def get_search_responses(self) -> Dict[Tuple[Optional[str], Optional[str]], str]:
+        """Get the search_incidents responses memoized for the cached data"""
+        return self._search_responses
+    
+    def get_cache_info_json(self) -> str:
+        """Get get_cache_info() pre-serialized as JSON"""
+        if self._data is None:
+            return _EMPTY_CACHE_INFO_JSON
+        if self.is_expired():
+            return self._cache_info_expired_json
+        return self._cache_info_valid_json
     
     def get_cache_info(self) -> Dict[str, Any]:
         """Get information about cache status"""
-        if self._cached_data is None:
+        if self._data is None:
             return {"status": "empty", "cached_items": 0}
         
-        return {
-            "status": "expired" if self.is_expired() else "valid",
-            "cached_items": len(self._cached_data.data),
-            "cached_at": self._cached_data.timestamp.isoformat(),
-            "expires_at": self._cached_data.expires_at.isoformat(),
-            "cache_duration_minutes": self.cache_duration.total_seconds() / 60
-        }
+        return {"status": "expired" if self.is_expired() else "valid", **self._cache_info}
 
 
 class MVGDataFetcher:
     """Fetches and processes MVG disruption data"""
     
     MVG_API_URL = "https://www.mvg.de/api/bgw-pt/v3/messages"
+    MESSAGE_KEYS = ("messages", "data", "items", "results")
+    
+    # Refreshes happen every cache period (10 minutes), keep the connection
+    # alive a bit longer so consecutive refreshes reuse it
+    KEEPALIVE_EXPIRY = 700.0
     
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # httpx already negotiates gzip/deflate; HTTP/2 reuses one TLS connection
+        self.client = httpx.AsyncClient(
+            http2=True,
+            timeout=30.0,
+            headers={"User-Agent": "mvg-stoerung-mcp/1.0"},
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=self.KEEPALIVE_EXPIRY),
+        )
     
     async def fetch_raw_data(self) -> Dict[str, Any]:
         """Fetch raw data from MVG API"""
         try:
-            response = await self.client.get(self.MVG_API_URL)
-            response.raise_for_status()
-            return response.json()
+            # Stream so error statuses are raised before the body is read
+            async with self.client.stream("GET", self.MVG_API_URL) as response:
+                response.raise_for_status()
+                body = await response.aread()
+            # Parse the raw bytes directly, skipping the str decode
+            return orjson.loads(body)
         except httpx.RequestError as e:
             logger.error(f"Error fetching data from MVG API: {e}")
             raise
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Error parsing JSON response: {e}")
             raise
     
+    def _extract_messages(self, data: Any) -> List[Any]:
+        """Locate the message list in the API response"""
+        # Parsed JSON only contains exact list/dict types, so identity checks suffice
+        if type(data) is list:
+            return data
+        if type(data) is dict:
+            # Try common keys where messages might be stored
+            for key in self.MESSAGE_KEYS:
+                messages = data.get(key)
+                if type(messages) is list:
+                    return messages
+            # If no common key found, check if the dict itself contains type field
+            if "type" in data:
+                return [data]
+        return []
+    
+    def _iter_incidents(self, data: Any) -> Iterator[Dict[str, Any]]:
+        """Yield the INCIDENT type messages of the API response"""
+        for message in self._extract_messages(data):
+            if type(message) is dict and message.get("type") == "INCIDENT":
+                yield message
+    
     def filter_incidents(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Filter messages to return only INCIDENT type elements"""
-        incidents = []
-        
-        # Handle different possible data structures
-        messages = []
-        if isinstance(data, list):
-            messages = data
-        elif isinstance(data, dict):
-            # Try common keys where messages might be stored
-            for key in ["messages", "data", "items", "results"]:
-                if key in data and isinstance(data[key], list):
-                    messages = data[key]
-                    break
-            else:
-                # If no common key found, check if the dict itself contains type field
-                if "type" in data:
-                    messages = [data]
-        
-        # Filter for INCIDENT type
-        for message in messages:
-            if isinstance(message, dict) and message.get("type") == "INCIDENT":
-                incidents.append(message)
-        
-        return incidents
+        return list(self._iter_incidents(data))
     
     def format_timestamp(self, timestamp: int) -> str:
         """Convert Unix timestamp (milliseconds) to readable format"""
-        try:
-            dt = datetime.fromtimestamp(timestamp / 1000)
-            return dt.strftime("%d.%m.%Y %H:%M")
-        except (ValueError, OSError):
-            return str(timestamp)
+        # Range check instead of try/except: MVG timestamps are always in range
+        if 0 <= timestamp < _MAX_TIMESTAMP_MS:
+            # Divide rather than multiply by 0.001 so whole seconds stay exact
+            return datetime.fromtimestamp(timestamp / 1000).strftime(_READABLE_TIMESTAMP_FORMAT)
+        return str(timestamp)
     
     def enhance_incident_data(self, incident: Dict[str, Any]) -> Dict[str, Any]:
-        """Add human-readable fields to incident data"""
-        enhanced = incident.copy()
-        
-        # Add readable timestamps
-        if "publication" in enhanced and isinstance(enhanced["publication"], int):
-            enhanced["publication_readable"] = self.format_timestamp(enhanced["publication"])
+        """Add human-readable fields to incident data (returns the incident itself if none apply)"""
+        fmt = self.format_timestamp
+        readable = {}
         
-        if "validFrom" in enhanced and isinstance(enhanced["validFrom"], int):
-            enhanced["validFrom_readable"] = self.format_timestamp(enhanced["validFrom"])
+        # Add readable timestamps, parsed JSON numbers are exact ints
+        for source, target in _TIMESTAMP_FIELDS:
+            value = incident.get(source)
+            if type(value) is int:
+                readable[target] = fmt(value)
         
-        if "validTo" in enhanced and isinstance(enhanced["validTo"], int):
-            enhanced["validTo_readable"] = self.format_timestamp(enhanced["validTo"])
-        
-        return enhanced
+        # The raw incident is freshly parsed and not shared, so skip the copy
+        # when there is nothing to add
+        if not readable:
+            return incident
+        return {**incident, **readable}
     
     async def fetch_incidents(self) -> List[Dict[str, Any]]:
         """Fetch and process incident data"""
         raw_data = await self.fetch_raw_data()
-        incidents = self.filter_incidents(raw_data)
+        enhance = self.enhance_incident_data
         
-        # Enhance each incident with readable timestamps
-        enhanced_incidents = [self.enhance_incident_data(incident) for incident in incidents]
+        # Filter for INCIDENT type and add readable timestamps in a single pass
+        enhanced_incidents = [enhance(incident) for incident in self._iter_incidents(raw_data)]
         
         logger.info(f"Fetched {len(enhanced_incidents)} incidents from MVG API")
         return enhanced_incidents
@@ -169,57 +299,176 @@ class MVGDataFetcher:
         await self.client.aclose()
 
 
-# Create server instance
-server = Server("mvg-stoerung")
+class _State:
+    """Shared server components, bundled so handlers need a single global lookup"""
+    __slots__ = ("server", "cache", "fetcher", "refresh_lock", "refresh_task")
+    
+    def __init__(self, server: Server, cache: MVGCache, fetcher: MVGDataFetcher):
+        self.server = server
+        self.cache = cache
+        self.fetcher = fetcher
+        self.refresh_lock = asyncio.Lock()
+        self.refresh_task: Optional[asyncio.Task] = None
+
+
+# Create server instance and initialize components
+_STATE = _State(
+    server=Server("mvg-stoerung"),
+    cache=MVGCache(cache_duration_minutes=10),
+    fetcher=MVGDataFetcher(),
+)
+server = _STATE.server
+cache = _STATE.cache
+fetcher = _STATE.fetcher
+
+
+def _incidents_json(incidents: List[Dict[str, Any]]) -> str:
+    """Get incidents returned by get_incidents() as JSON, reusing the cached serialization"""
+    # get_incidents() leaves the incidents it returns in the cache, unless a
+    # refresh replaced them in the meantime
+    cache = _STATE.cache
+    serialized = cache.get_serialized() if cache.holds(incidents) else None
+    if serialized is None:
+        serialized = _dumps(incidents)
+    return serialized
+
 
-# Initialize components
-cache = MVGCache(cache_duration_minutes=10)
-fetcher = MVGDataFetcher()
+def _incidents_search_index(incidents: List[Dict[str, Any]]) -> List[SearchEntry]:
+    """Get the search index for incidents returned by get_incidents()"""
+    cache = _STATE.cache
+    search_index = cache.get_search_index() if cache.holds(incidents) else None
+    if search_index is None:
+        search_index = [_search_entry(incident) for incident in incidents]
+    return search_index
 
 
 async def get_incidents(force_refresh: bool = False) -> List[Dict[str, Any]]:
     """Get incidents with caching"""
+    state = _STATE
+    cache = state.cache
+    
     if not force_refresh:
         cached_data = cache.get()
         if cached_data is not None:
             logger.info(f"Returning {len(cached_data)} cached incidents")
             return cached_data
+        
+        # Stale-while-revalidate: serve recently expired data right away and
+        # refresh it in the background
+        stale_data = cache.get_stale_ok()
+        if stale_data is not None:
+            if state.refresh_task is None or state.refresh_task.done():
+                state.refresh_task = asyncio.create_task(_background_refresh())
+            logger.info(f"Returning {len(stale_data)} stale incidents while refreshing")
+            return stale_data
+    
+    return await _refresh_incidents(force_refresh=force_refresh)
+
+
+async def _refresh_incidents(force_refresh: bool = False) -> List[Dict[str, Any]]:
+    """Fetch fresh incidents into the cache"""
+    state = _STATE
+    cache = state.cache
     
-    # Fetch fresh data
-    logger.info("Fetching fresh data from MVG API")
-    incidents = await fetcher.fetch_incidents()
-    cache.set(incidents)
-    return incidents
+    # Only one coroutine refreshes at a time, concurrent callers wait for it
+    async with state.refresh_lock:
+        if not force_refresh:
+            cached_data = cache.get()
+            if cached_data is not None:
+                logger.info(f"Returning {len(cached_data)} incidents refreshed by a concurrent request")
+                return cached_data
+        
+        # Fetch fresh data
+        logger.info("Fetching fresh data from MVG API")
+        incidents = await state.fetcher.fetch_incidents()
+        cache.set(incidents)
+        return incidents
+
+
+async def _background_refresh() -> None:
+    """Refresh the cache without a waiting caller"""
+    try:
+        await _refresh_incidents()
+    except Exception as e:
+        # Stale data keeps being served, the next request retries
+        logger.error(f"Background refresh failed: {e}")
+
+
+# Resource and tool definitions are static, build them once at import
+_RESOURCES: List[Resource] = [
+    Resource(
+        uri="mvg://incidents",
+        name="MVG Incidents",
+        description="Current incidents from Munich Public Transport (MVG)",
+        mimeType="application/json",
+    ),
+    Resource(
+        uri="mvg://cache-info",
+        name="Cache Information",
+        description="Information about the current cache status",
+        mimeType="application/json",
+    ),
+]
+
+_TOOLS: List[Tool] = [
+    Tool(
+        name="get_mvg_incidents",
+        description="Get current MVG incidents (cached for 10+ minutes)",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "force_refresh": {
+                    "type": "boolean",
+                    "description": "Force refresh cache even if not expired",
+                    "default": False
+                }
+            }
+        },
+    ),
+    Tool(
+        name="get_cache_status",
+        description="Get information about the cache status",
+        inputSchema={
+            "type": "object",
+            "properties": {}
+        },
+    ),
+    Tool(
+        name="search_incidents",
+        description="Search incidents by line, title, or description",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "Search query (searches in title, description, and line labels)"
+                },
+                "line": {
+                    "type": "string",
+                    "description": "Filter by specific line (e.g., 'U6', 'S1', 'Bus 100')"
+                }
+            },
+            "required": ["query"]
+        },
+    ),
+]
 
 
 @server.list_resources()
 async def handle_list_resources() -> list[Resource]:
     """List available resources"""
-    return [
-        Resource(
-            uri="mvg://incidents",
-            name="MVG Incidents",
-            description="Current incidents from Munich Public Transport (MVG)",
-            mimeType="application/json",
-        ),
-        Resource(
-            uri="mvg://cache-info",
-            name="Cache Information",
-            description="Information about the current cache status",
-            mimeType="application/json",
-        ),
-    ]
+    return _RESOURCES
 
 
 @server.read_resource()
 async def handle_read_resource(uri: str) -> str:
     """Read resource content"""
+    cache = _STATE.cache
     if uri == "mvg://incidents":
         incidents = await get_incidents()
-        return json.dumps(incidents, indent=2, ensure_ascii=False)
+        return _incidents_json(incidents)
     elif uri == "mvg://cache-info":
-        cache_info = cache.get_cache_info()
-        return json.dumps(cache_info, indent=2, ensure_ascii=False)
+        return cache.get_cache_info_json()
     else:
         raise ValueError(f"Unknown resource: {uri}")
 
@@ -227,125 +476,104 @@ async def handle_read_resource(uri: str) -> str:
 @server.list_tools()
 async def handle_list_tools() -> list[Tool]:
     """List available tools"""
-    return [
-        Tool(
-            name="get_mvg_incidents",
-            description="Get current MVG incidents (cached for 10+ minutes)",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "force_refresh": {
-                        "type": "boolean",
-                        "description": "Force refresh cache even if not expired",
-                        "default": False
-                    }
-                }
-            },
-        ),
-        Tool(
-            name="get_cache_status",
-            description="Get information about the cache status",
-            inputSchema={
-                "type": "object",
-                "properties": {}
-            },
-        ),
-        Tool(
-            name="search_incidents",
-            description="Search incidents by line, title, or description",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "query": {
-                        "type": "string",
-                        "description": "Search query (searches in title, description, and line labels)"
-                    },
-                    "line": {
-                        "type": "string",
-                        "description": "Filter by specific line (e.g., 'U6', 'S1', 'Bus 100')"
-                    }
-                },
-                "required": ["query"]
-            },
-        ),
-    ]
+    return _TOOLS
 
 
-@server.call_tool()
-async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
-    """Handle tool calls"""
-    if name == "get_mvg_incidents":
-        force_refresh = arguments.get("force_refresh", False)
-        incidents = await get_incidents(force_refresh=force_refresh)
-        
-        result = {
-            "incidents": incidents,
-            "count": len(incidents),
-            "cache_info": cache.get_cache_info()
-        }
-        
-        return [TextContent(
-            type="text",
-            text=json.dumps(result, indent=2, ensure_ascii=False)
-        )]
-    
-    elif name == "get_cache_status":
-        cache_info = cache.get_cache_info()
-        return [TextContent(
-            type="text",
-            text=json.dumps(cache_info, indent=2, ensure_ascii=False)
-        )]
-    
-    elif name == "search_incidents":
-        query = arguments.get("query", "").lower()
-        line_filter = arguments.get("line", "").upper()
-        
-        incidents = await get_incidents()
-        filtered_incidents = []
-        
-        for incident in incidents:
-            # Search in title and description
-            title_match = query in incident.get("title", "").lower()
-            desc_match = query in incident.get("description", "").lower()
-            
-            # Search in line labels
-            line_match = False
-            if "lines" in incident:
-                for line in incident["lines"]:
-                    if isinstance(line, dict) and "label" in line:
-                        if query in line["label"].lower():
-                            line_match = True
-                            break
-            
-            # Apply line filter if specified
-            line_filter_match = True
-            if line_filter:
-                line_filter_match = False
-                if "lines" in incident:
-                    for line in incident["lines"]:
-                        if isinstance(line, dict) and "label" in line:
-                            if line_filter in line["label"].upper():
-                                line_filter_match = True
-                                break
-            
-            if (title_match or desc_match or line_match) and line_filter_match:
+async def _tool_incidents(arguments: dict) -> list[TextContent]:
+    """Return all current incidents together with the cache status"""
+    force_refresh = arguments.get("force_refresh", False)
+    incidents = await get_incidents(force_refresh=force_refresh)
+    
+    # Splice the pre-serialized incidents into the response instead of
+    # re-encoding them, matching what _dumps() would produce
+    result = "".join((
+        '{\n  "incidents": ', _nest_json(_incidents_json(incidents)),
+        ',\n  "count": ', str(len(incidents)),
+        ',\n  "cache_info": ', _nest_json(_STATE.cache.get_cache_info_json()),
+        "\n}",
+    ))
+    
+    return [TextContent(
+        type="text",
+        text=result
+    )]
+
+
+async def _tool_cache(arguments: dict) -> list[TextContent]:
+    """Return the cache status"""
+    return [TextContent(
+        type="text",
+        text=_STATE.cache.get_cache_info_json()
+    )]
+
+
+def _search_response(incidents: List[Dict[str, Any]], raw_query: Optional[str],
+                     raw_line: Optional[str]) -> str:
+    """Search incidents and serialize the search_incidents response"""
+    query = (raw_query or "").lower()
+    line_filter = (raw_line or "").upper()
+    filtered_incidents = []
+    
+    # A separator in the arguments could match across fields or labels, so
+    # such searches match nothing
+    if _SEARCH_SEPARATOR not in query and _SEARCH_SEPARATOR not in line_filter:
+        # One substring search per haystack instead of one per field and label
+        for incident, (text, upper_labels) in zip(incidents, _incidents_search_index(incidents)):
+            if query in text and (not line_filter or line_filter in upper_labels):
                 filtered_incidents.append(incident)
-        
-        result = {
-            "incidents": filtered_incidents,
-            "count": len(filtered_incidents),
-            "query": arguments.get("query"),
-            "line_filter": arguments.get("line"),
-            "total_incidents": len(incidents)
-        }
-        
-        return [TextContent(
-            type="text",
-            text=json.dumps(result, indent=2, ensure_ascii=False)
-        )]
     
+    result = {
+        "incidents": filtered_incidents,
+        "count": len(filtered_incidents),
+        "query": raw_query,
+        "line_filter": raw_line,
+        "total_incidents": len(incidents)
+    }
+    return _dumps(result)
+
+
+async def _tool_search(arguments: dict) -> list[TextContent]:
+    """Return incidents matching a search query and optional line filter"""
+    raw_query = arguments.get("query")
+    raw_line = arguments.get("line")
+    
+    incidents = await get_incidents()
+    # Responses are memoized per cached incident list; the response echoes the raw
+    # arguments, so they are the key. Anything but strings (unhashable JSON
+    # values included) is searched uncached.
+    cache = _STATE.cache
+    if (type(raw_query) not in _SEARCH_ARG_TYPES or type(raw_line) not in _SEARCH_ARG_TYPES
+            or not cache.holds(incidents)):
+        result = _search_response(incidents, raw_query, raw_line)
     else:
+        responses = cache.get_search_responses()
+        key = (raw_query, raw_line)
+        result = responses.get(key)
+        if result is None:
+            result = _search_response(incidents, raw_query, raw_line)
+            if len(responses) < _MAX_SEARCH_RESPONSES:
+                responses[key] = result
+    
+    return [TextContent(
+        type="text",
+        text=result
+    )]
+
+
+_TOOL_HANDLERS: Dict[str, Callable[[dict], Awaitable[list[TextContent]]]] = {
+    "get_mvg_incidents": _tool_incidents,
+    "get_cache_status": _tool_cache,
+    "search_incidents": _tool_search,
+}
+
+
+@server.call_tool()
+async def handle_call_tool(name: str, arguments: dict) -> list[TextContent]:
+    """Handle tool calls"""
+    handler = _TOOL_HANDLERS.get(name)
+    if handler is None:
         raise ValueError(f"Unknown tool: {name}")
+    return await handler(arguments)
 
 
 async def main():
@@ -367,8 +595,22 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Server interrupted")
     finally:
-        await fetcher.close()
+        # Stop a pending background refresh before its HTTP client goes away
+        refresh_task = _STATE.refresh_task
+        if refresh_task is not None and not refresh_task.done():
+            refresh_task.cancel()
+            try:
+                await refresh_task
+            except asyncio.CancelledError:
+                pass
+        await _STATE.fetcher.close()
+
+
+def run() -> None:
+    """Run the server, on uvloop when it is installed"""
+    runner = uvloop.run if uvloop is not None else asyncio.run
+    runner(main())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run()
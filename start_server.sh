@@ -14,9 +14,9 @@ fi
 source venv/bin/activate
 
 # Install dependencies if needed
-if ! python -c "import httpx, pydantic" 2>/dev/null; then
+if ! python -c "import httpx, h2, pydantic, orjson" 2>/dev/null; then
     echo "Installing dependencies..."
-    pip install httpx pydantic
+    pip install "httpx[http2]" pydantic orjson
 fi
 
 # Try to install MCP if not available
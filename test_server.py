@@ -1,55 +1,122 @@
+import asyncio
 import json
 import pytest
+import mvg_mcp_server
 from mvg_mcp_server import (
     MVGDataFetcher, 
     MVGCache, 
     get_incidents, 
     handle_call_tool,
-    cache
+    cache,
+    _dumps
 )
 
 @pytest.mark.asyncio
 async def test_data_fetcher(mock_mvg_api):
     """Test the MVG data fetcher with a mocked API."""
+    incidents = await mvg_mcp_server.fetcher.fetch_incidents()
+    assert len(incidents) == 1
+    assert incidents[0]["title"] == "U-Bahn Störung"
+    assert mock_mvg_api.call_count == 1
+
+def test_filter_incidents():
+    """Test incident filtering across the supported response shapes."""
     fetcher = MVGDataFetcher()
-    try:
-        incidents = await fetcher.fetch_incidents()
-        assert len(incidents) == 1
-        assert incidents[0]["title"] == "U-Bahn Störung"
-    finally:
-        await fetcher.close()
+    incident = {"type": "INCIDENT", "title": "Störung"}
+    info = {"type": "INFO", "title": "Bauarbeiten"}
+
+    assert fetcher.filter_incidents([incident, info, "junk"]) == [incident]
+    assert fetcher.filter_incidents({"messages": [info, incident]}) == [incident]
+    assert fetcher.filter_incidents({"data": {}, "items": [incident]}) == [incident]
+    assert fetcher.filter_incidents(incident) == [incident]
+    assert fetcher.filter_incidents({"unrelated": True}) == []
+
+def test_enhance_incident_data():
+    """Test that readable timestamps are added only for integer timestamps."""
+    fetcher = MVGDataFetcher()
+    incident = {"type": "INCIDENT", "publication": 1700000040000, "validTo": "unknown"}
+
+    enhanced = fetcher.enhance_incident_data(incident)
+    assert enhanced["publication_readable"] == fetcher.format_timestamp(1700000040000)
+    assert "validTo_readable" not in enhanced
+    assert "publication_readable" not in incident
+
+    plain = {"type": "INCIDENT", "title": "Störung"}
+    assert fetcher.enhance_incident_data(plain) == plain
+
+    # Out-of-range timestamps are returned as-is
+    assert fetcher.format_timestamp(-1) == "-1"
+    assert fetcher.format_timestamp(10**16) == str(10**16)
 
 def test_cache():
     """Test the cache functionality."""
     local_cache = MVGCache(cache_duration_minutes=1)
     assert local_cache.is_expired()
+    assert local_cache.get_cache_info_json() == _dumps(local_cache.get_cache_info())
     
     test_data = [{"id": 1, "title": "Test incident"}]
     local_cache.set(test_data)
     
     assert not local_cache.is_expired()
     assert local_cache.get() == test_data
+    assert local_cache.get_cache_info_json() == _dumps(local_cache.get_cache_info())
+
+def test_cache_expiry():
+    """Test that cached data expires after the cache duration."""
+    local_cache = MVGCache(cache_duration_minutes=0)
+    local_cache.set([{"id": 1, "title": "Test incident"}])
+
+    assert local_cache.is_expired()
+    assert local_cache.get() is None
+    assert local_cache.get_cache_info()["status"] == "expired"
+    assert local_cache.get_cache_info_json() == _dumps(local_cache.get_cache_info())
 
 @pytest.mark.asyncio
 async def test_get_incidents_caching(mock_mvg_api):
     """Test the get_incidents function with caching."""
     # Clear global cache for predictable test
-    cache._cached_data = None
+    cache.clear()
 
     # First call should fetch from API
     incidents = await get_incidents()
     assert len(incidents) == 1
-    assert mock_mvg_api.get("/").call_count == 1
+    assert mock_mvg_api.call_count == 1
 
     # Second call should use cache
     incidents2 = await get_incidents()
     assert len(incidents2) == 1
-    assert mock_mvg_api.get("/").call_count == 1 # Should not have increased
+    assert mock_mvg_api.call_count == 1 # Should not have increased
+
+@pytest.mark.asyncio
+async def test_get_incidents_concurrent_refresh(mock_mvg_api):
+    """Test that concurrent cache misses share a single API request."""
+    cache.clear()
+
+    results = await asyncio.gather(*(get_incidents() for _ in range(5)))
+    assert all(len(incidents) == 1 for incidents in results)
+    assert mock_mvg_api.call_count == 1
+
+@pytest.mark.asyncio
+async def test_get_incidents_stale_while_revalidate(mock_mvg_api, monkeypatch):
+    """Test that recently expired data is served while refreshing in the background."""
+    # Data expires immediately but stays within the stale grace period
+    stale_cache = MVGCache(cache_duration_minutes=0, stale_grace_minutes=5)
+    monkeypatch.setattr(mvg_mcp_server._STATE, "cache", stale_cache)
+    stale_cache.set([{"type": "INCIDENT", "title": "Alte Störung"}])
+    assert stale_cache.get() is None
+
+    incidents = await get_incidents()
+    assert incidents[0]["title"] == "Alte Störung"
+    assert mock_mvg_api.call_count == 0
+
+    await mvg_mcp_server._STATE.refresh_task
+    assert mock_mvg_api.call_count == 1
+    assert stale_cache.get_stale_ok()[0]["title"] == "U-Bahn Störung"
 
 @pytest.mark.asyncio
 async def test_search_incidents(mock_mvg_api):
     """Test the search_incidents tool."""
-    cache._cached_data = None # Clear cache
+    cache.clear()
 
     # Search for "U-Bahn"
     search_args = {"query": "U-Bahn"}
@@ -63,3 +130,105 @@ async def test_search_incidents(mock_mvg_api):
     result_content = await handle_call_tool("search_incidents", search_args)
     result = json.loads(result_content[0].text)
     assert result["count"] == 0
+
+@pytest.mark.asyncio
+async def test_get_mvg_incidents_response(mock_mvg_api):
+    """Test that the spliced get_mvg_incidents response matches a full serialization."""
+    cache.clear()
+
+    result_content = await handle_call_tool("get_mvg_incidents", {})
+    text = result_content[0].text
+    result = json.loads(text)
+    assert result["count"] == 1
+    assert result["incidents"][0]["title"] == "U-Bahn Störung"
+    assert result["cache_info"]["status"] == "valid"
+    assert text == _dumps({
+        "incidents": cache.get(),
+        "count": 1,
+        "cache_info": cache.get_cache_info()
+    })
+
+@pytest.mark.asyncio
+async def test_search_incidents_by_line(mock_mvg_api):
+    """Test searching by line label and filtering by line."""
+    cache.clear()
+
+    # Line labels are searched case-insensitively
+    result_content = await handle_call_tool("search_incidents", {"query": "u3"})
+    result = json.loads(result_content[0].text)
+    assert result["count"] == 1
+
+    # Line filter keeps matching incidents
+    result_content = await handle_call_tool("search_incidents", {"query": "störung", "line": "u3"})
+    result = json.loads(result_content[0].text)
+    assert result["count"] == 1
+    assert result["line_filter"] == "u3"
+
+    # Line filter drops incidents on other lines
+    result_content = await handle_call_tool("search_incidents", {"query": "störung", "line": "U6"})
+    result = json.loads(result_content[0].text)
+    assert result["count"] == 0
+    assert result["total_incidents"] == 1
+
+    # Separator characters never match across fields or labels
+    for search_args in ({"query": "\x01"}, {"query": "störung\x01"},
+                        {"query": "störung", "line": "U3\x01S8"}):
+        result_content = await handle_call_tool("search_incidents", search_args)
+        result = json.loads(result_content[0].text)
+        assert result["count"] == 0
+        assert result["total_incidents"] == 1
+
+@pytest.mark.asyncio
+async def test_unknown_tool():
+    """Test that unknown tool names are rejected."""
+    with pytest.raises(ValueError, match="Unknown tool: no_such_tool"):
+        await handle_call_tool("no_such_tool", {})
+
+@pytest.mark.asyncio
+async def test_search_incidents_memoized(mock_mvg_api):
+    """Test that search responses are memoized per cached incident list."""
+    cache.clear()
+
+    first = await handle_call_tool("search_incidents", {"query": "u3"})
+    assert list(cache.get_search_responses()) == [("u3", None)]
+    second = await handle_call_tool("search_incidents", {"query": "u3"})
+    assert second[0].text == first[0].text
+
+    # Refreshing the cache drops the memo, old responses are not reused
+    cache.set([])
+    assert cache.get_search_responses() == {}
+    result_content = await handle_call_tool("search_incidents", {"query": "u3"})
+    result = json.loads(result_content[0].text)
+    assert result["count"] == 0
+    assert result["total_incidents"] == 0
+
+    # Incidents no longer in the cache are searched with their own index
+    incident = {"type": "INCIDENT", "title": "Störung", "lines": [{"label": "U3"}]}
+    result = json.loads(mvg_mcp_server._search_response([incident], "u3", None))
+    assert result["count"] == 1
+
+def test_cache_non_string_fields():
+    """Test that incidents with non-string text fields can still be cached."""
+    test_cache = MVGCache(cache_duration_minutes=1)
+    incident = {"type": "INCIDENT", "title": 5, "description": None, "lines": [{"label": "U6"}]}
+    test_cache.set([incident])
+
+    assert test_cache.get() == [incident]
+    assert test_cache.get_search_index() == [("\x01\x01u6", "U6")]
+
+def test_cache_set_failure_keeps_previous_data():
+    """Test that a failing set() leaves the previously cached data intact."""
+    test_cache = MVGCache(cache_duration_minutes=1)
+    incident = {"type": "INCIDENT", "title": "Störung", "lines": 5}
+    test_cache.set([incident])
+    assert test_cache.get_search_index() == [("störung\x01\x01", "")]
+
+    search_responses = test_cache.get_search_responses()
+    cache_info_json = test_cache.get_cache_info_json()
+    with pytest.raises(TypeError):
+        test_cache.set([{"type": "INCIDENT", "title": object()}])
+
+    assert test_cache.get() == [incident]
+    assert test_cache.get_serialized() == _dumps([incident])
+    assert test_cache.get_search_responses() is search_responses
+    assert test_cache.get_cache_info_json() == cache_info_json